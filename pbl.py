@@ -4,8 +4,15 @@ from hashlib import sha256
 import pandas as pd
 import google.generativeai as genai
 import os
+import re
 import subprocess
+import threading
+import time
 from urllib.parse import urlencode
+from schema_engine import (COLUMN_TYPES, apply_schema_changes, describe_change, get_columns,
+                           needs_rebuild, plan_columns, quote_identifier)
+from snapshots import (SNAPSHOT_RETENTION, get_snapshot_error, is_snapshot_running, list_snapshots,
+                       restore_snapshot, start_snapshot, take_snapshot)
 
 # Check for the google-generativeai package
 output = subprocess.run(["pip", "show", "google-generativeai"], capture_output=True, text=True)
@@ -254,6 +261,14 @@ def get_user_db_path(username):
     conn.close()
     return result[0] if result and result[0] else None
 
+def get_db_path_owners(db_path):
+    conn = sqlite3.connect("users.db")
+    cursor = conn.cursor()
+    cursor.execute("SELECT username FROM users WHERE db_path = ?", (db_path,))
+    result = cursor.fetchall()
+    conn.close()
+    return [row[0] for row in result]
+
 def update_user_db_path(username, db_path):
     conn = sqlite3.connect("users.db")
     cursor = conn.cursor()
@@ -279,7 +294,7 @@ with st.sidebar:
     if st.session_state["logged_in"]:
         if st.button("🚪 Logout", key="logout_btn"):
             st.session_state["logged_in"] = False
-            for key in ["username", "db_schema", "db_path", "show_table_data"]:
+            for key in ["username", "db_schema", "db_path", "show_table_data", "last_sql_query", "last_upload_id"]:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
@@ -331,6 +346,336 @@ with st.sidebar:
     - Save your database for later use
     """)
 
+#############################################
+# CHART AGGREGATION HELPERS                 #
+#############################################
+# Charts never pull raw result rows: grouping, binning and time-bucketing
+# are pushed into SQLite and only the aggregated points are fetched.
+CHART_MAX_POINTS = 2000
+CHART_AGGREGATES = ["COUNT", "SUM", "AVG", "MIN", "MAX"]
+CHART_TIME_BUCKETS = {
+    "Hour": "strftime('%Y-%m-%d %H:00', {col})",
+    "Day": "date({col})",
+    "Week": "date({col}, 'weekday 0', '-6 days')",
+    "Month": "strftime('%Y-%m', {col})",
+    "Year": "strftime('%Y', {col})",
+}
+
+def strip_sql_terminator(sql_query):
+    return sql_query.strip().rstrip(";").strip()
+
+def wrap_subquery(sql_query):
+    # The newline keeps a trailing "--" comment from swallowing the parenthesis
+    return f"({strip_sql_terminator(sql_query)}\n)"
+
+def get_query_columns(conn, sql_query):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM {wrap_subquery(sql_query)} LIMIT 0")
+    return [desc[0] for desc in cursor.description]
+
+def build_chart_query(sql_query, x_col, mode, agg, y_col=None, bins=20, time_bucket="Day"):
+    """Build the aggregated chart query and its parameters for a result set."""
+    qx = f"_chart_source.{quote_identifier(x_col)}"
+    y_expr = "COUNT(*)" if agg == "COUNT" or not y_col else f"{agg}(_chart_source.{quote_identifier(y_col)})"
+    sources = "_chart_source"
+    ctes = [f"_chart_source AS {wrap_subquery(sql_query)}"]
+    params = []
+
+    if mode == "Numeric bins":
+        # Bounds come from a second CTE so the result set is read in one query;
+        # SQLite materializes _chart_source once because it is referenced twice
+        ctes.append(
+            f"_chart_bounds AS (SELECT MIN({qx}) AS low, "
+            f"CASE WHEN MAX({qx}) > MIN({qx}) THEN (MAX({qx}) - MIN({qx})) * 1.0 / ? ELSE 1.0 END AS width "
+            f"FROM _chart_source WHERE {qx} IS NOT NULL)"
+        )
+        params.append(bins)
+        sources += ", _chart_bounds"
+        x_expr = (f"_chart_bounds.low + MIN(CAST(({qx} - _chart_bounds.low) / _chart_bounds.width AS INTEGER), ?)"
+                  f" * _chart_bounds.width")
+        params.append(bins - 1)
+    elif mode == "Time buckets":
+        x_expr = CHART_TIME_BUCKETS[time_bucket].format(col=qx)
+    else:
+        x_expr = qx
+
+    query = (
+        f"WITH {', '.join(ctes)} "
+        f"SELECT {x_expr} AS x, {y_expr} AS y FROM {sources} "
+        f"WHERE {qx} IS NOT NULL GROUP BY 1 ORDER BY 1 LIMIT ?"
+    )
+    # Fetch one extra point so callers can tell the chart was truncated
+    params.append(CHART_MAX_POINTS + 1)
+    return query, params
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def fetch_chart_data(db_path, data_version, sql_query, x_col, mode, agg, y_col=None, bins=20, time_bucket="Day"):
+    """Run the chart query; data_version (the file's mtime) invalidates the cache after writes."""
+    query, params = build_chart_query(sql_query, x_col, mode, agg, y_col, bins, time_bucket)
+    conn = sqlite3.connect(db_path)
+    try:
+        start = time.perf_counter()
+        chart_df = pd.read_sql_query(query, conn, params=params)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    finally:
+        conn.close()
+    truncated = len(chart_df) > CHART_MAX_POINTS
+    return chart_df.head(CHART_MAX_POINTS), truncated, elapsed_ms
+
+def render_chart_panel(db_path, sql_query):
+    st.markdown("### 📈 Chart Results")
+    try:
+        conn = sqlite3.connect(db_path)
+        columns = get_query_columns(conn, sql_query)
+        conn.close()
+    except Exception as e:
+        st.error(f"Error reading query columns: {e}")
+        return
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        x_col = st.selectbox("X axis:", columns, key="chart_x_col")
+        mode = st.selectbox("Grouping:", ["Group by value", "Numeric bins", "Time buckets"], key="chart_mode")
+    with col2:
+        agg = st.selectbox("Aggregate:", CHART_AGGREGATES, key="chart_agg")
+        y_col = None
+        if agg != "COUNT":
+            y_col = st.selectbox("Y axis:", columns, key="chart_y_col")
+    with col3:
+        chart_type = st.selectbox("Chart:", ["Bar", "Line"], key="chart_type")
+        bins = 20
+        time_bucket = "Day"
+        if mode == "Numeric bins":
+            bins = st.number_input("Bins:", min_value=2, max_value=CHART_MAX_POINTS, value=20, key="chart_bins")
+        elif mode == "Time buckets":
+            time_bucket = st.selectbox("Bucket:", list(CHART_TIME_BUCKETS), index=1, key="chart_time_bucket")
+
+    try:
+        chart_df, truncated, elapsed_ms = fetch_chart_data(db_path, os.path.getmtime(db_path), sql_query, x_col, mode, agg,
+                                                           y_col, int(bins), time_bucket)
+    except Exception as e:
+        st.error(f"Error building chart: {e}")
+        return
+
+    if chart_df.empty:
+        st.warning("No data to chart for the selected column.")
+        return
+
+    chart_df = chart_df.set_index("x")
+    if chart_type == "Line":
+        st.line_chart(chart_df, use_container_width=True)
+    else:
+        st.bar_chart(chart_df, use_container_width=True)
+
+    st.caption(f"Aggregated in the database in {elapsed_ms:,.0f} ms (cached until the query, settings or data change).")
+    if truncated:
+        st.info(f"Showing the first {CHART_MAX_POINTS} points. Use bins or time buckets to summarise more data.")
+
+#############################################
+# FULL-TEXT SEARCH INDEX (FTS5)             #
+#############################################
+# Each user table can get an external-content FTS5 shadow table named
+# "<table>_fts" over its text columns, kept in sync by triggers.
+FTS_SUFFIX = "_fts"
+FTS_SEARCH_LIMIT = 100
+
+def fts_table_name(table_name):
+    return f"{table_name}{FTS_SUFFIX}"
+
+def get_fts_tables(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' "
+        "AND sql LIKE 'CREATE VIRTUAL TABLE%' AND sql LIKE '%fts5%'"
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+def list_user_tables(cursor):
+    """Return user table names, hiding FTS indexes and their shadow tables."""
+    fts_tables = get_fts_tables(cursor)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+    tables = []
+    for (name,) in cursor.fetchall():
+        if name in fts_tables or any(name.startswith(f"{fts}_") for fts in fts_tables):
+            continue
+        tables.append(name)
+    return tables
+
+def get_text_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({quote_identifier(table_name)})")
+    text_columns = []
+    for col in cursor.fetchall():
+        col_type = (col[2] or "").upper()
+        if not col_type or any(t in col_type for t in ("TEXT", "CHAR", "CLOB")):
+            text_columns.append(col[1])
+    return text_columns
+
+def get_fts_columns(db_path, table_name):
+    """Return the indexed columns for a table, or an empty list if it has no index."""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        fts_name = fts_table_name(table_name)
+        if fts_name not in get_fts_tables(cursor):
+            return []
+        cursor.execute(f"PRAGMA table_info({quote_identifier(fts_name)})")
+        return [col[1] for col in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def drop_fts_index(cursor, table_name):
+    fts_name = fts_table_name(table_name)
+    # Never touch a user table that merely happens to use the index name
+    if fts_name not in get_fts_tables(cursor):
+        return
+    for suffix in ("ai", "ad", "au"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {quote_identifier(f'{fts_name}_{suffix}')}")
+    cursor.execute(f"DROP TABLE IF EXISTS {quote_identifier(fts_name)}")
+
+def has_rowid(cursor, table_name):
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name = ?", (table_name,))
+    row = cursor.fetchone()
+    return not (row and row[0] and re.search(r"WITHOUT\s+ROWID", row[0], re.IGNORECASE))
+
+def create_fts_index(cursor, table_name):
+    """Create, populate and attach sync triggers for a table's FTS index.
+
+    Raises ValueError when the table cannot be indexed.
+    """
+    if not has_rowid(cursor, table_name):
+        raise ValueError("WITHOUT ROWID tables cannot have a full-text index.")
+    text_columns = get_text_columns(cursor, table_name)
+    if not text_columns:
+        raise ValueError("The table has no text columns to index.")
+    fts_name = fts_table_name(table_name)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts_name,))
+    if cursor.fetchone() and fts_name not in get_fts_tables(cursor):
+        raise ValueError(f"A table named '{fts_name}' already exists.")
+
+    fts = quote_identifier(fts_table_name(table_name))
+    table = quote_identifier(table_name)
+    cols = ", ".join(quote_identifier(c) for c in text_columns)
+    new_vals = ", ".join(f"new.{quote_identifier(c)}" for c in text_columns)
+    old_vals = ", ".join(f"old.{quote_identifier(c)}" for c in text_columns)
+    trigger = lambda suffix: quote_identifier(f"{fts_table_name(table_name)}_{suffix}")
+
+    drop_fts_index(cursor, table_name)
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, "
+        f"content={quote_identifier(table_name)}, content_rowid='rowid')"
+    )
+    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    cursor.execute(
+        f"CREATE TRIGGER {trigger('ai')} AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_vals}); END"
+    )
+    cursor.execute(
+        f"CREATE TRIGGER {trigger('ad')} AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_vals}); END"
+    )
+    cursor.execute(
+        f"CREATE TRIGGER {trigger('au')} AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_vals}); END"
+    )
+
+@st.cache_resource
+def get_fts_build_errors():
+    """Failed builds keyed by (db_path, table); shared with background threads across reruns."""
+    return {}
+
+def build_fts_indexes(db_path, table_names=None, errors=None):
+    """Build FTS indexes for the given tables (all unindexed user tables by default)."""
+    built = []
+    errors = {} if errors is None else errors
+    # Autocommit mode so each table's build runs in one explicit transaction;
+    # otherwise CREATE VIRTUAL TABLE commits on its own and survives a rollback.
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        if table_names is None:
+            indexed = get_fts_tables(cursor)
+            table_names = [t for t in list_user_tables(cursor) if fts_table_name(t) not in indexed]
+        for table_name in table_names:
+            error_key = (os.path.abspath(db_path), table_name)
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                create_fts_index(cursor, table_name)
+                cursor.execute("COMMIT")
+                errors.pop(error_key, None)
+                built.append(table_name)
+            except (sqlite3.Error, ValueError) as e:
+                if conn.in_transaction:
+                    cursor.execute("ROLLBACK")
+                errors[error_key] = str(e)
+    finally:
+        conn.close()
+    return built
+
+def fts_build_thread_name(db_path):
+    return f"fts-build-{os.path.abspath(db_path)}"
+
+def is_fts_build_running(db_path):
+    name = fts_build_thread_name(db_path)
+    return any(t.name == name and t.is_alive() for t in threading.enumerate())
+
+def start_fts_index_build(db_path, table_names=None):
+    """Build FTS indexes on a background thread so uploads return immediately."""
+    if is_fts_build_running(db_path):
+        return
+    thread = threading.Thread(
+        target=build_fts_indexes,
+        args=(db_path, table_names, get_fts_build_errors()),
+        name=fts_build_thread_name(db_path),
+        daemon=True,
+    )
+    thread.start()
+
+def to_fts_query(search_text):
+    # Quote every term so user input is never parsed as FTS5 syntax; the
+    # trailing * turns each term into a prefix match.
+    terms = search_text.split()
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+def search_table(db_path, table_name, search_text, limit=FTS_SEARCH_LIMIT):
+    fts = quote_identifier(fts_table_name(table_name))
+    table = quote_identifier(table_name)
+    query = (
+        f"SELECT {table}.rowid AS rowid, {table}.* FROM {fts} "
+        f"JOIN {table} ON {table}.rowid = {fts}.rowid "
+        f"WHERE {fts} MATCH ? ORDER BY {fts}.rank LIMIT ?"
+    )
+    conn = sqlite3.connect(db_path)
+    try:
+        return pd.read_sql_query(query, conn, params=(to_fts_query(search_text), limit))
+    finally:
+        conn.close()
+
+def render_table_search(db_path, table_name, key):
+    indexed_columns = get_fts_columns(db_path, table_name)
+    if not indexed_columns:
+        build_error = get_fts_build_errors().get((os.path.abspath(db_path), table_name))
+        if is_fts_build_running(db_path):
+            st.info("🔎 Full-text search index is being built in the background...")
+            return
+        if build_error:
+            st.error(f"Could not build the search index: {build_error}")
+        if st.button("🔎 Build search index", key=f"{key}_build_btn"):
+            start_fts_index_build(db_path, [table_name])
+            st.info("🔎 Building full-text search index in the background...")
+        return
+
+    search_text = st.text_input(f"🔎 Search {table_name}:", key=f"{key}_input",
+                                help=f"Searches columns: {', '.join(indexed_columns)}")
+    if search_text.strip():
+        try:
+            start = time.perf_counter()
+            results_df = search_table(db_path, table_name, search_text)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            st.dataframe(results_df, use_container_width=True)
+            st.caption(f"{len(results_df)} matching rows in {elapsed_ms:.1f} ms")
+        except Exception as e:
+            st.error(f"Error searching table: {e}")
+
 #############################################
 # 2) MAIN APP: FILE UPLOAD & SQL CONVERSION #
 #############################################
@@ -370,10 +715,7 @@ if st.session_state["logged_in"]:
                 try:
                     conn = sqlite3.connect(db_path)
                     cursor = conn.cursor()
-                    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                    tables = cursor.fetchall()
-                    for table in tables:
-                        table_name = table[0]
+                    for table_name in list_user_tables(cursor):
                         cursor.execute(f"PRAGMA table_info({table_name})")
                         columns = cursor.fetchall()
                         schema_str = f"Table: {table_name}\n"
@@ -391,15 +733,24 @@ if st.session_state["logged_in"]:
             if "using_new_upload" not in st.session_state:
                 st.session_state["using_new_upload"] = False
                 
+            build_search_index = st.checkbox("Build full-text search index after upload", value=True,
+                                             help="Indexes text columns in the background for fast searching")
             uploaded_file = st.file_uploader("Upload a .sql, .db, or .sqlite3 file", 
                                           type=["sql", "db", "sqlite3"],
                                           help="Upload your database file to query and manage it")
             
             if uploaded_file is not None:
                 st.session_state["using_new_upload"] = True
-                for key in [schema_key, path_key]:
-                    if key in st.session_state:
-                        del st.session_state[key]
+
+                # The uploader keeps its file across reruns; only process it once so
+                # later saves, restores and snapshots are not overwritten
+                upload_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}-{uploaded_file.size}"
+                is_new_upload = st.session_state.get("last_upload_id") != upload_id
+                st.session_state["last_upload_id"] = upload_id
+                if is_new_upload:
+                    for key in [schema_key, path_key, "last_sql_query"]:
+                        if key in st.session_state:
+                            del st.session_state[key]
                 
                 db_schema_dict = {}
                 db_path = None
@@ -450,11 +801,8 @@ if st.session_state["logged_in"]:
                     try:
                         conn = sqlite3.connect(db_path)
                         cursor = conn.cursor()
-                        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                        tables = cursor.fetchall()
                         schema_dict = {}
-                        for table in tables:
-                            table_name = table[0]
+                        for table_name in list_user_tables(cursor):
                             cursor.execute(f"PRAGMA table_info({table_name})")
                             columns = cursor.fetchall()
                             schema_str = f"Table: {table_name}\n"
@@ -468,30 +816,47 @@ if st.session_state["logged_in"]:
                         return {}
                 
                 local_file_path = os.path.join("./", uploaded_file.name)
-                with open(local_file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+
+                if is_new_upload:
+                    if uploaded_file.name.endswith((".db", ".sqlite3")) and os.path.exists(local_file_path):
+                        # Keep the database this upload is about to overwrite, in the
+                        # history of whoever it belongs to
+                        for owner in get_db_path_owners(local_file_path):
+                            try:
+                                take_snapshot(local_file_path, owner=owner)
+                            except Exception as e:
+                                st.warning(f"Could not snapshot the existing {uploaded_file.name}: {e}")
+
+                    with open(local_file_path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
                 
-                st.markdown("<div class='success-msg animated'>File uploaded successfully!</div>", 
-                           unsafe_allow_html=True)
+                    st.markdown("<div class='success-msg animated'>File uploaded successfully!</div>", 
+                               unsafe_allow_html=True)
                 
-                if uploaded_file.name.endswith(".sql"):
-                    temp_db_path = f"converted_database_{current_user}.db"
-                    with st.spinner("Converting SQL file to SQLite database..."):
-                        if convert_sql_to_db(local_file_path, temp_db_path):
-                            db_path = temp_db_path
-                            update_user_db_path(current_user, db_path)
-                            db_schema_dict = get_db_schema(db_path)
-                            st.session_state[schema_key] = db_schema_dict
-                            st.session_state[path_key] = db_path
-                            st.success("SQL file converted successfully!")
-                        else:
-                            st.error("Failed to convert .sql file. Please check the SQL syntax.")
-                elif uploaded_file.name.endswith((".db", ".sqlite3")):
-                    db_path = local_file_path
-                    update_user_db_path(current_user, db_path)
-                    db_schema_dict = get_db_schema(db_path)
-                    st.session_state[schema_key] = db_schema_dict
-                    st.session_state[path_key] = db_path
+                    if uploaded_file.name.endswith(".sql"):
+                        temp_db_path = f"converted_database_{current_user}.db"
+                        with st.spinner("Converting SQL file to SQLite database..."):
+                            if convert_sql_to_db(local_file_path, temp_db_path):
+                                db_path = temp_db_path
+                                update_user_db_path(current_user, db_path)
+                                db_schema_dict = get_db_schema(db_path)
+                                st.session_state[schema_key] = db_schema_dict
+                                st.session_state[path_key] = db_path
+                                if build_search_index:
+                                    start_fts_index_build(db_path)
+                                start_snapshot(db_path, owner=current_user)
+                                st.success("SQL file converted successfully!")
+                            else:
+                                st.error("Failed to convert .sql file. Please check the SQL syntax.")
+                    elif uploaded_file.name.endswith((".db", ".sqlite3")):
+                        db_path = local_file_path
+                        update_user_db_path(current_user, db_path)
+                        db_schema_dict = get_db_schema(db_path)
+                        st.session_state[schema_key] = db_schema_dict
+                        st.session_state[path_key] = db_path
+                        if build_search_index:
+                            start_fts_index_build(db_path)
+                        start_snapshot(db_path, owner=current_user)
         
         # Display schema in a better format
         if st.session_state.get(schema_key):
@@ -520,6 +885,58 @@ if st.session_state["logged_in"]:
                 st.markdown("</div>", unsafe_allow_html=True)
         else:
             st.warning("No schema extracted. Please upload a valid database file.")
+
+        # Snapshot history: every write is preceded by a snapshot
+        if st.session_state.get(path_key) and os.path.exists(st.session_state[path_key]):
+            db_path = st.session_state[path_key]
+            with st.expander("🕒 Database Snapshots"):
+                st.markdown(f"A snapshot is taken before every save. The {SNAPSHOT_RETENTION} most recent are kept.")
+                if "snapshot_result" in st.session_state:
+                    st.markdown(f"<div class='success-msg animated'>{st.session_state.pop('snapshot_result')}</div>",
+                                unsafe_allow_html=True)
+
+                if is_snapshot_running(db_path):
+                    st.info("📸 A snapshot is being taken in the background...")
+                elif get_snapshot_error(db_path):
+                    st.error(f"The last background snapshot failed: {get_snapshot_error(db_path)}")
+                if st.button("📸 Take Snapshot Now", key="take_snapshot_btn"):
+                    start_snapshot(db_path, owner=current_user)
+                    st.session_state["snapshot_result"] = "Snapshot started in the background."
+                    st.rerun()
+
+                snapshot_list = list_snapshots(db_path, owner=current_user)
+                if snapshot_list:
+                    snapshot_labels = {path: taken_at.strftime("%Y-%m-%d %H:%M:%S") for path, taken_at in snapshot_list}
+                    selected_snapshot = st.selectbox("Snapshot:", list(snapshot_labels),
+                                                     format_func=lambda path: snapshot_labels[path],
+                                                     key="selected_snapshot")
+                    if st.button("♻️ Restore Snapshot", key="restore_snapshot_btn"):
+                        try:
+                            restore_snapshot(selected_snapshot, db_path, owner=current_user)
+
+                            # Re-extract the schema, the restored version may differ
+                            db_schema_dict = {}
+                            conn = sqlite3.connect(db_path)
+                            cursor = conn.cursor()
+                            for table_name in list_user_tables(cursor):
+                                cursor.execute(f"PRAGMA table_info({quote_identifier(table_name)})")
+                                columns = cursor.fetchall()
+                                schema_str = f"Table: {table_name}\n"
+                                for col in columns:
+                                    schema_str += f"  - {col[1]} ({col[2]})\n"
+                                db_schema_dict[table_name] = schema_str
+                            conn.close()
+                            st.session_state[schema_key] = db_schema_dict
+
+                            st.session_state["snapshot_result"] = (
+                                f"Restored snapshot from {snapshot_labels[selected_snapshot]}. "
+                                "The previous state was saved as a new snapshot."
+                            )
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"Error restoring snapshot: {e}")
+                else:
+                    st.info("No snapshots yet.")
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -554,6 +971,10 @@ if st.session_state["logged_in"]:
             except Exception as e:
                 st.error(f"Error executing shared SQL: {e}")
 
+        if "selected_table" in st.session_state and st.session_state.get(path_key):
+            with st.expander("🔎 Search table contents"):
+                render_table_search(st.session_state[path_key], st.session_state["selected_table"], key="translator_search")
+
         english_query = st.text_area("Enter your English query:", 
                                   placeholder="Example: Show me all employees who work in the sales department",
                                   height=100)
@@ -561,6 +982,8 @@ if st.session_state["logged_in"]:
         run_query = st.button("🔍 Convert to SQL", key="run_query_btn")
 
         if run_query:
+            # Only a successful translation below brings the chart back
+            st.session_state.pop("last_sql_query", None)
             if not english_query.strip():
                 st.warning("Please enter a query to convert.")
             elif "selected_table" not in st.session_state:
@@ -569,6 +992,17 @@ if st.session_state["logged_in"]:
                 selected_table = st.session_state["selected_table"]
                 table_schema = st.session_state[schema_key][selected_table]
 
+                # Let the model use the full-text index for "contains" questions
+                fts_hint = ""
+                fts_columns = get_fts_columns(st.session_state[path_key], selected_table)
+                if fts_columns:
+                    fts_name = fts_table_name(selected_table)
+                    fts_hint = f"""
+Full-Text Index:
+An FTS5 index named '{fts_name}' covers the columns {", ".join(fts_columns)}.
+For questions about text that contains words, filter with rowid IN (SELECT rowid FROM {fts_name} WHERE {fts_name} MATCH 'word') instead of LIKE.
+"""
+
                 with st.spinner("Converting your query to SQL..."):
                     def generate_sql(nl_query, schema):
                         prompt = f"""
@@ -577,6 +1011,7 @@ IMPORTANT: Ensure the query returns each row only once. Use DISTINCT if necessar
 
 Table Schema:
 {schema}
+{fts_hint}
 
 Natural Language Query:
 {nl_query}
@@ -636,11 +1071,17 @@ SQL Query:
                                 )
 
                             conn.close()
+
+                            # Keep the query so the chart panel survives widget reruns
+                            st.session_state["last_sql_query"] = sql_output
                         except Exception as e:
                             st.error(f"Error executing SQL: {e}")
                     else:
                         st.warning("SQL generation failed. Try rewording your query and try again.")
 
+        if st.session_state.get("last_sql_query") and st.session_state.get(path_key):
+            render_chart_panel(st.session_state[path_key], st.session_state["last_sql_query"])
+
     #############################################
     # 4) TABLE EDITOR SECTION                   #
     #############################################
@@ -657,54 +1098,145 @@ SQL Query:
             if st.button("👁️ Show Table Data", key="show_table"):
                 st.session_state["show_table_data"] = True
 
-            # Add column section
-            add_col_expander = st.expander("Add a new column")
-            with add_col_expander:
+            # Full-text search section
+            if st.session_state.get(path_key):
+                with st.expander("🔎 Search table contents"):
+                    render_table_search(st.session_state[path_key], selected_table, key="editor_search")
+
+            # Schema editor section: column changes are queued, then applied together
+            pending_key = f"pending_schema_{selected_table}"
+            if pending_key not in st.session_state:
+                st.session_state[pending_key] = []
+            pending_changes = st.session_state[pending_key]
+
+            schema_expander = st.expander("Edit table schema")
+            with schema_expander:
+                if "schema_change_result" in st.session_state:
+                    result_msg, skipped = st.session_state.pop("schema_change_result")
+                    st.markdown(f"<div class='success-msg animated'>{result_msg}</div>", unsafe_allow_html=True)
+                    if skipped:
+                        st.warning(f"Could not recreate: {', '.join(skipped)}")
+
+                try:
+                    conn = sqlite3.connect(st.session_state[path_key])
+                    current_columns = get_columns(conn.cursor(), selected_table)
+                    conn.close()
+                    planned_names = [col["name"] for col in plan_columns(current_columns, pending_changes)]
+                except Exception as e:
+                    st.error(f"Error reading table schema: {e}")
+                    planned_names = []
+
+                st.markdown("#### Add a new column")
                 col1, col2 = st.columns([3, 1])
                 with col1:
                     new_column_name = st.text_input("New column name:", key="new_column_name")
                 with col2:
-                    col_type = st.selectbox("Type:", ["TEXT", "INTEGER", "REAL", "BLOB", "NUMERIC"])
+                    col_type = st.selectbox("Type:", COLUMN_TYPES)
 
                 if st.button("➕ Add Column", key="add_column_btn"):
-                    if new_column_name:
+                    if not new_column_name:
+                        st.warning("Please enter a column name.")
+                    elif new_column_name.lower() in [name.lower() for name in planned_names]:
+                        st.warning(f"Column '{new_column_name}' already exists.")
+                    else:
+                        pending_changes.append({"op": "add", "column": new_column_name, "type": col_type})
+                        st.rerun()
+
+                if planned_names:
+                    st.markdown("#### Modify an existing column")
+                    col1, col2, col3 = st.columns([2, 1, 1])
+                    with col1:
+                        target_column = st.selectbox("Column:", planned_names, key="schema_target_column")
+                    with col2:
+                        new_type = st.selectbox("New type:", COLUMN_TYPES, key="schema_new_type")
+                    with col3:
+                        new_position = st.number_input("New position:", min_value=1, max_value=len(planned_names),
+                                                       value=1, key="schema_new_position")
+
+                    col1, col2, col3 = st.columns([1, 1, 1])
+                    with col1:
+                        if st.button("🔁 Change Type", key="retype_column_btn"):
+                            pending_changes.append({"op": "retype", "column": target_column, "type": new_type})
+                            st.rerun()
+                    with col2:
+                        if st.button("↕️ Move Column", key="move_column_btn"):
+                            pending_changes.append({"op": "move", "column": target_column, "position": int(new_position) - 1})
+                            st.rerun()
+                    with col3:
+                        if st.button("🗑️ Drop Column", key="drop_column_btn"):
+                            if len(planned_names) == 1:
+                                st.warning("A table must keep at least one column.")
+                            else:
+                                pending_changes.append({"op": "drop", "column": target_column})
+                                st.rerun()
+
+                if pending_changes:
+                    st.markdown("#### Pending changes")
+                    st.markdown("\n".join(f"{i + 1}. {describe_change(change)}" for i, change in enumerate(pending_changes)))
+                    if needs_rebuild(pending_changes):
+                        st.info("These changes rebuild the table, which may take a while on large tables.")
+
+                    col1, col2 = st.columns([1, 1])
+                    with col1:
+                        apply_changes = st.button("✅ Apply Changes", key="apply_schema_btn")
+                    with col2:
+                        if st.button("✖️ Clear Pending", key="clear_schema_btn"):
+                            st.session_state[pending_key] = []
+                            st.rerun()
+
+                    if apply_changes:
+                        db_path = st.session_state[path_key]
+                        had_search_index = False
+                        progress_bar = st.progress(0.0, text="Applying schema changes...")
+
+                        def report_progress(done, total):
+                            progress_bar.progress(min(done / total, 1.0) if total else 1.0,
+                                                  text=f"Copying rows: {done:,} / {total:,}")
+
                         try:
-                            # Connect to the database
-                            conn = sqlite3.connect(st.session_state[path_key])
+                            # Snapshot before any write so the change can be rolled back
+                            with st.spinner("Taking a snapshot before applying changes..."):
+                                take_snapshot(db_path, owner=current_user)
+
+                            # The FTS index mirrors the old columns; drop it and re-index afterwards
+                            conn = sqlite3.connect(db_path)
                             cursor = conn.cursor()
+                            had_search_index = fts_table_name(selected_table) in get_fts_tables(cursor)
+                            if had_search_index:
+                                drop_fts_index(cursor, selected_table)
+                                conn.commit()
+                            conn.close()
+
+                            summary = apply_schema_changes(db_path, selected_table, pending_changes,
+                                                           progress=report_progress)
 
-                            # Check if the column already exists
-                            cursor.execute(f"PRAGMA table_info({selected_table})")
+                            # Update the schema
+                            conn = sqlite3.connect(db_path)
+                            cursor = conn.cursor()
+                            db_schema_dict = st.session_state[schema_key]
+                            cursor.execute(f"PRAGMA table_info({quote_identifier(selected_table)})")
                             columns = cursor.fetchall()
-                            column_names = [col[1] for col in columns]
+                            schema_str = f"Table: {selected_table}\n"
+                            for col in columns:
+                                schema_str += f"  - {col[1]} ({col[2]})\n"
+                            db_schema_dict[selected_table] = schema_str
+                            st.session_state[schema_key] = db_schema_dict
+                            conn.close()
 
-                            if new_column_name in column_names:
-                                st.warning(f"Column '{new_column_name}' already exists.")
+                            if summary["rebuilt"]:
+                                result_msg = (f"Table rebuilt with {len(pending_changes)} change(s): "
+                                              f"{summary['rows']:,} rows in {summary['seconds']:.2f}s")
                             else:
-                                # Add the new column
-                                cursor.execute(f"ALTER TABLE {selected_table} ADD COLUMN {new_column_name} {col_type}")
-                                conn.commit()
-
-                                # Update the schema
-                                db_schema_dict = st.session_state[schema_key]
-                                cursor.execute(f"PRAGMA table_info({selected_table})")
-                                columns = cursor.fetchall()
-                                schema_str = f"Table: {selected_table}\n"
-                                for col in columns:
-                                    schema_str += f"  - {col[1]} ({col[2]})\n"
-                                db_schema_dict[selected_table] = schema_str
-                                st.session_state[schema_key] = db_schema_dict
-
-                                st.markdown("<div class='success-msg animated'>Column added successfully!</div>", 
-                                           unsafe_allow_html=True)
-                                st.session_state["show_table_data"] = True  # Show table after adding column
-                                st.rerun()  # Refresh the page to see the new column
+                                result_msg = f"{len(pending_changes)} column(s) added successfully!"
+                            st.session_state["schema_change_result"] = (result_msg, summary["skipped"])
+                            st.session_state[pending_key] = []
+                            st.session_state["show_table_data"] = True  # Show table after changing schema
+                            st.rerun()  # Refresh the page to see the new schema
                         except Exception as e:
-                            st.error(f"Error adding column: {e}")
+                            st.error(f"Error applying schema changes: {e}")
                         finally:
-                            conn.close()
-                    else:
-                        st.warning("Please enter a column name.")
+                            if had_search_index:
+                                start_fts_index_build(db_path, [selected_table])
 
             # Display table data if the button is clicked
             if st.session_state.get("show_table_data", False):
@@ -724,6 +1256,10 @@ SQL Query:
                     # Save changes button
                     if st.button("💾 Save Changes", key="save_changes_btn"):
                         try:
+                            # Snapshot before writing so a bad save can be rolled back
+                            with st.spinner("Taking a snapshot before saving..."):
+                                take_snapshot(st.session_state[path_key], owner=current_user)
+
                             # Update each row in the table
                             for _, row in edited_df.iterrows():
                                 # Construct the UPDATE query
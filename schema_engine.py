@@ -0,0 +1,407 @@
+"""Batched schema changes for SQLite tables.
+
+Column changes are queued as plain dicts and applied together in one
+transaction:
+
+    {"op": "add", "column": "email", "type": "TEXT"}
+    {"op": "drop", "column": "legacy"}
+    {"op": "retype", "column": "age", "type": "INTEGER"}
+    {"op": "move", "column": "email", "position": 1}
+
+When every change is an ADD COLUMN the table is altered in place. Anything
+else uses SQLite's recommended rebuild: create a new table, bulk copy with
+INSERT ... SELECT, drop the old table, rename and recreate indexes and
+triggers. The new table reuses each column definition and table constraint
+verbatim from the stored CREATE TABLE statement, so UNIQUE, CHECK, COLLATE,
+DEFAULT and REFERENCES clauses survive; a retype only swaps the type name.
+Dropping a column that a constraint still refers to fails the rebuild.
+
+Run this file directly to benchmark rebuild time:
+
+    python schema_engine.py --rows 1000000
+"""
+import argparse
+import os
+import re
+import sqlite3
+import tempfile
+import time
+
+COLUMN_TYPES = ["TEXT", "INTEGER", "REAL", "BLOB", "NUMERIC"]
+REBUILD_BATCH_SIZE = 50000
+TABLE_CONSTRAINT_KEYWORDS = {"CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN"}
+COLUMN_CONSTRAINT_KEYWORDS = {"CONSTRAINT", "PRIMARY", "NOT", "NULL", "UNIQUE", "CHECK", "DEFAULT",
+                              "COLLATE", "REFERENCES", "GENERATED", "AS"}
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def get_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({quote_identifier(table_name)})")
+    return [
+        {"name": col[1], "type": col[2], "notnull": bool(col[3]), "default": col[4], "pk": col[5], "source": col[1]}
+        for col in cursor.fetchall()
+    ]
+
+
+def plan_columns(columns, changes):
+    """Return the column list that results from applying changes in order.
+
+    Each planned column keeps a "source" naming the existing column its data
+    is copied from, or None for a newly added column.
+    """
+    planned = [dict(col) for col in columns]
+
+    def find(name):
+        for index, col in enumerate(planned):
+            if col["name"].lower() == name.lower():
+                return index
+        raise ValueError(f"Column '{name}' does not exist.")
+
+    for change in changes:
+        op = change["op"]
+        name = change["column"]
+        if op == "add":
+            if any(col["name"].lower() == name.lower() for col in planned):
+                raise ValueError(f"Column '{name}' already exists.")
+            planned.append({"name": name, "type": change["type"], "notnull": False,
+                            "default": None, "pk": 0, "source": None})
+        elif op == "drop":
+            del planned[find(name)]
+        elif op == "retype":
+            planned[find(name)]["type"] = change["type"]
+            planned[find(name)]["retyped"] = True
+        elif op == "move":
+            col = planned.pop(find(name))
+            position = max(0, min(int(change["position"]), len(planned)))
+            planned.insert(position, col)
+        else:
+            raise ValueError(f"Unknown schema change '{op}'.")
+
+    if not planned:
+        raise ValueError("A table must keep at least one column.")
+    return planned
+
+
+def needs_rebuild(changes):
+    return any(change["op"] != "add" for change in changes)
+
+
+def describe_change(change):
+    op = change["op"]
+    if op == "add":
+        return f"Add column {change['column']} ({change['type']})"
+    if op == "drop":
+        return f"Drop column {change['column']}"
+    if op == "retype":
+        return f"Change type of {change['column']} to {change['type']}"
+    return f"Move column {change['column']} to position {int(change['position']) + 1}"
+
+
+def split_create_table_sql(sql):
+    """Split a CREATE TABLE statement into its column/constraint definitions.
+
+    Returns (definitions, suffix) where suffix holds any table options after
+    the closing parenthesis, such as WITHOUT ROWID or STRICT. Comments are
+    dropped.
+    """
+    definitions = []
+    current = []
+    depth = 0
+    i = 0
+    while i < len(sql):
+        ch = sql[i]
+        if ch in "\"'`[":
+            close = "]" if ch == "[" else ch
+            end = i + 1
+            while end < len(sql):
+                if sql[end] == close:
+                    # A doubled quote is an escaped quote inside the name/string
+                    if close != "]" and sql[end + 1:end + 2] == close:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            if depth:
+                current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        if sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            i = len(sql) if newline == -1 else newline
+            continue
+        if sql.startswith("/*", i):
+            close = sql.find("*/", i + 2)
+            i = len(sql) if close == -1 else close + 2
+            current.append(" ")
+            continue
+        if ch == "(":
+            depth += 1
+            if depth == 1:
+                i += 1
+                continue
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                definitions.append("".join(current).strip())
+                return definitions, sql[i + 1:].strip()
+        elif ch == "," and depth == 1:
+            definitions.append("".join(current).strip())
+            current = []
+            i += 1
+            continue
+        if depth:
+            current.append(ch)
+        i += 1
+    raise ValueError("Could not parse the table definition.")
+
+
+def split_column_definition(definition):
+    """Return (name, rest) for a column definition, or (None, definition) for a table constraint."""
+    match = re.match(r'\s*("(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\]|\'(?:[^\']|\'\')*\'|[^\s(]+)', definition)
+    token = match.group(1)
+    if token.upper() in TABLE_CONSTRAINT_KEYWORDS:
+        return None, definition
+    if token[0] in "\"`'":
+        name = token[1:-1].replace(token[0] * 2, token[0])
+    elif token[0] == "[":
+        name = token[1:-1]
+    else:
+        name = token
+    return name, definition[match.end():]
+
+
+def replace_column_type(rest, new_type):
+    """Swap the type name at the start of a column definition's remainder."""
+    position = 0
+    while True:
+        word = re.match(r"\s*([A-Za-z_][A-Za-z0-9_]*)", rest[position:])
+        if not word or word.group(1).upper() in COLUMN_CONSTRAINT_KEYWORDS:
+            break
+        position += word.end()
+        size = re.match(r"\s*\([^)]*\)", rest[position:])
+        if size:
+            position += size.end()
+            break
+    return f" {new_type}{rest[position:]}"
+
+
+def build_create_table_sql(table_name, original_sql, planned):
+    definitions, suffix = split_create_table_sql(original_sql)
+    column_definitions = {}
+    table_constraints = []
+    for definition in definitions:
+        name, rest = split_column_definition(definition)
+        if name is None:
+            table_constraints.append(definition)
+        else:
+            column_definitions[name.lower()] = rest
+
+    new_definitions = []
+    for col in planned:
+        if col["source"] is None:
+            rest = f" {col['type']}"
+        else:
+            rest = column_definitions[col["source"].lower()]
+            if col.get("retyped"):
+                rest = replace_column_type(rest, col["type"])
+        new_definitions.append(f"{quote_identifier(col['name'])}{rest}".strip())
+
+    return (f"CREATE TABLE {quote_identifier(table_name)} "
+            f"({', '.join(new_definitions + table_constraints)}) {suffix}").strip()
+
+
+def _add_columns(cursor, table_name, changes):
+    for change in changes:
+        cursor.execute(
+            f"ALTER TABLE {quote_identifier(table_name)} ADD COLUMN "
+            f"{quote_identifier(change['column'])} {change['type']}"
+        )
+
+
+def _working_views(cursor):
+    """Return the names of views that currently compile."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='view'")
+    working = []
+    for (name,) in cursor.fetchall():
+        try:
+            cursor.execute(f"SELECT * FROM {quote_identifier(name)} LIMIT 0")
+            working.append(name)
+        except sqlite3.Error:
+            pass
+    return working
+
+
+def _rebuild_table(cursor, table_name, planned, progress=None, batch_size=REBUILD_BATCH_SIZE):
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name = ?", (table_name,))
+    table_sql = cursor.fetchone()[0]
+    create_sql = build_create_table_sql(f"_rebuild_{table_name}", table_sql, planned)
+    without_rowid = re.search(r"WITHOUT\s+ROWID\s*$", split_create_table_sql(table_sql)[1], re.IGNORECASE)
+
+    # Remember the AUTOINCREMENT counter so deleted ids are never handed out again
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_sequence'")
+    sequence = None
+    if cursor.fetchone():
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table_name,))
+        row = cursor.fetchone()
+        sequence = row[0] if row else None
+
+    # Indexes and triggers are dropped with the old table; keep them to recreate
+    cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE tbl_name = ? "
+        "AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table_name,),
+    )
+    dependents = cursor.fetchall()
+    # legacy_alter_table skips view checks on RENAME, so compare views afterwards
+    views = _working_views(cursor)
+
+    table = quote_identifier(table_name)
+    new_table = quote_identifier(f"_rebuild_{table_name}")
+    cursor.execute(f"DROP TABLE IF EXISTS {new_table}")
+    cursor.execute(create_sql)
+    # Check the rebuilt table itself: a lone INTEGER PRIMARY KEY aliases the rowid
+    new_pk = [col for col in get_columns(cursor, f"_rebuild_{table_name}") if col["pk"]]
+    keeps_rowid_alias = len(new_pk) == 1 and (new_pk[0]["type"] or "").upper() == "INTEGER"
+
+    copied = [col for col in planned if col["source"] is not None]
+    target_cols = ", ".join(quote_identifier(col["name"]) for col in copied)
+    source_cols = ", ".join(quote_identifier(col["source"]) for col in copied)
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    total_rows = cursor.fetchone()[0]
+
+    if without_rowid:
+        cursor.execute(f"INSERT INTO {new_table} ({target_cols}) SELECT {source_cols} FROM {table}")
+        if progress:
+            progress(total_rows, total_rows)
+    else:
+        # Preserve rowids explicitly unless an INTEGER PRIMARY KEY already carries them
+        if not keeps_rowid_alias:
+            target_cols = ", ".join(["rowid"] + [quote_identifier(col["name"]) for col in copied])
+            source_cols = ", ".join(["rowid"] + [quote_identifier(col["source"]) for col in copied])
+        # Copy in rowid-keyed batches so progress can be reported on large tables
+        cursor.execute(f"SELECT MIN(rowid) FROM {table}")
+        start = cursor.fetchone()[0]
+        done = 0
+        while start is not None:
+            cursor.execute(
+                f"SELECT rowid FROM {table} WHERE rowid >= ? ORDER BY rowid LIMIT 1 OFFSET ?",
+                (start, batch_size),
+            )
+            row = cursor.fetchone()
+            end = row[0] if row else None
+            where, params = ("rowid >= ? AND rowid < ?", (start, end)) if end is not None else ("rowid >= ?", (start,))
+            cursor.execute(
+                f"INSERT INTO {new_table} ({target_cols}) SELECT {source_cols} FROM {table} WHERE {where}",
+                params,
+            )
+            done += cursor.rowcount
+            if progress:
+                progress(done, total_rows)
+            start = end
+
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+
+    if sequence is not None:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence, table_name))
+        if cursor.rowcount == 0:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table_name, sequence))
+
+    broken = sorted(set(views) - set(_working_views(cursor)))
+    if broken:
+        raise ValueError(
+            f"This change would break the view(s) {', '.join(broken)}. "
+            "Update or drop them first, then apply the change again."
+        )
+
+    skipped = []
+    for name, sql in dependents:
+        try:
+            cursor.execute(sql)
+        except sqlite3.Error:
+            # Usually an index or trigger on a column that was dropped
+            skipped.append(name)
+    return total_rows, skipped
+
+
+def apply_schema_changes(db_path, table_name, changes, progress=None, batch_size=REBUILD_BATCH_SIZE):
+    """Apply queued column changes to a table in a single transaction.
+
+    progress, if given, is called as progress(rows_copied, total_rows) while
+    a rebuild copies data. Returns a summary dict with the keys "rebuilt",
+    "rows", "seconds" and "skipped" (indexes/triggers that could not be
+    recreated). Raises ValueError, leaving the table untouched, if a
+    rebuild would break a view that worked before.
+    """
+    start_time = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    cursor = conn.cursor()
+    summary = {"rebuilt": needs_rebuild(changes), "rows": 0, "seconds": 0.0, "skipped": []}
+    try:
+        # Both pragmas are no-ops inside a transaction, so set them first
+        cursor.execute("PRAGMA foreign_keys")
+        foreign_keys = cursor.fetchone()[0]
+        if summary["rebuilt"]:
+            cursor.execute("PRAGMA foreign_keys = OFF")
+            cursor.execute("PRAGMA legacy_alter_table = ON")
+
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            planned = plan_columns(get_columns(cursor, table_name), changes)
+            if summary["rebuilt"]:
+                summary["rows"], summary["skipped"] = _rebuild_table(
+                    cursor, table_name, planned, progress, batch_size
+                )
+            else:
+                _add_columns(cursor, table_name, changes)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            if summary["rebuilt"]:
+                cursor.execute("PRAGMA legacy_alter_table = OFF")
+                cursor.execute(f"PRAGMA foreign_keys = {int(foreign_keys)}")
+    finally:
+        conn.close()
+
+    summary["seconds"] = time.perf_counter() - start_time
+    return summary
+
+
+def run_benchmark(rows, batch_size=REBUILD_BATCH_SIZE):
+    """Time a drop + retype + move rebuild on a synthetic table."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, price TEXT, qty INTEGER, note TEXT)")
+        conn.execute("CREATE INDEX idx_items_name ON items (name)")
+        conn.executemany(
+            "INSERT INTO items (name, price, qty, note) VALUES (?, ?, ?, ?)",
+            ((f"item {i}", str(i % 1000 / 10), i % 50, "x" * 20) for i in range(rows)),
+        )
+        conn.commit()
+        conn.close()
+
+        changes = [
+            {"op": "drop", "column": "note"},
+            {"op": "retype", "column": "price", "type": "REAL"},
+            {"op": "move", "column": "qty", "position": 1},
+            {"op": "add", "column": "sku", "type": "TEXT"},
+        ]
+        summary = apply_schema_changes(db_path, "items", changes, batch_size=batch_size)
+
+    rate = summary["rows"] / summary["seconds"] if summary["seconds"] else 0
+    print(f"Rebuilt {summary['rows']} rows in {summary['seconds']:.2f}s ({rate:,.0f} rows/s, batch size {batch_size})")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark schema rebuild time")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.batch_size)
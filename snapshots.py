@@ -0,0 +1,275 @@
+"""Point-in-time snapshots of user databases.
+
+Snapshots are taken with SQLite's online backup API in small page steps,
+pausing between steps so writers can get the database lock. A write from
+another connection restarts the backup; after SNAPSHOT_MAX_RESTARTS restarts
+the copy finishes in a single step, which briefly holds writers off but
+always completes. Snapshots that exceed SNAPSHOT_TIMEOUT fail cleanly. The
+app takes one right
+before every write so a bad save can always be rolled back; uploads and
+manual snapshots run on a background thread. Each user's snapshots live in
+their own directory under SNAPSHOT_ROOT, so users uploading files with the
+same name never see each other's history. The newest SNAPSHOT_RETENTION
+copies are kept (set PBL_SNAPSHOT_RETENTION to change it).
+
+Run this file directly to benchmark the impact of snapshotting on
+concurrent read and write latency:
+
+    python snapshots.py --rows 500000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+from hashlib import sha256
+
+SNAPSHOT_ROOT = "snapshots"
+SNAPSHOT_RETENTION = int(os.environ.get("PBL_SNAPSHOT_RETENTION", "10"))
+SNAPSHOT_PAGES_PER_STEP = 256
+SNAPSHOT_STEP_SLEEP = 0.005
+SNAPSHOT_MAX_RESTARTS = 3
+SNAPSHOT_TIMEOUT = 60.0
+SNAPSHOT_SUFFIX = ".db"
+SNAPSHOT_TIME_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+# One snapshot or restore per database at a time, shared by every thread
+_snapshot_locks = {}
+_snapshot_locks_guard = threading.Lock()
+# Last background failure per database, cleared by the next success
+_snapshot_errors = {}
+
+
+def _snapshot_lock(db_path):
+    with _snapshot_locks_guard:
+        return _snapshot_locks.setdefault(os.path.abspath(db_path), threading.RLock())
+
+
+def snapshot_dir(db_path, owner=None):
+    """Return the snapshot directory for a database, per owner when given."""
+    if owner is None:
+        return f"{db_path}.snapshots"
+    # Hash the username so it is always a safe, single path component
+    owner_dir = sha256(owner.encode()).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_ROOT, owner_dir, f"{os.path.basename(db_path)}.snapshots")
+
+
+def list_snapshots(db_path, owner=None):
+    """Return (path, taken_at) pairs for a database, newest first."""
+    directory = snapshot_dir(db_path, owner)
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith(SNAPSHOT_SUFFIX):
+            continue
+        try:
+            taken_at = datetime.strptime(name[: -len(SNAPSHOT_SUFFIX)], SNAPSHOT_TIME_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append((os.path.join(directory, name), taken_at))
+    return sorted(snapshots, key=lambda snapshot: snapshot[1], reverse=True)
+
+
+def prune_snapshots(db_path, retention=SNAPSHOT_RETENTION, owner=None):
+    for path, _ in list_snapshots(db_path, owner)[max(retention, 1):]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def backup_database(source_path, target_path, pages=SNAPSHOT_PAGES_PER_STEP, sleep=SNAPSHOT_STEP_SLEEP,
+                    max_restarts=SNAPSHOT_MAX_RESTARTS, timeout=SNAPSHOT_TIMEOUT):
+    """Copy source_path into target_path and return the number of restarts.
+
+    Raises TimeoutError if the paced copy runs longer than timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    state = {"remaining": None, "restarts": 0}
+
+    def pace(status, remaining, total):
+        # Another connection's write makes the backup start over
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+        state["remaining"] = remaining
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Snapshot did not finish within {timeout:g}s.")
+        if state["restarts"] >= max_restarts:
+            raise _TooManyRestarts()
+        # Connection.backup() only sleeps on SQLITE_BUSY, so pace the steps here
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path, timeout=30)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=pace)
+        except _TooManyRestarts:
+            source.backup(target, pages=-1)
+    finally:
+        target.close()
+        source.close()
+    return state["restarts"]
+
+
+def take_snapshot(db_path, retention=SNAPSHOT_RETENTION, pages=SNAPSHOT_PAGES_PER_STEP, sleep=SNAPSHOT_STEP_SLEEP,
+                  prune=True, owner=None):
+    """Copy db_path into a new snapshot file and return its path."""
+    if not os.path.exists(db_path):
+        # sqlite3.connect would otherwise create an empty database to snapshot
+        raise FileNotFoundError(f"Database '{db_path}' does not exist.")
+    with _snapshot_lock(db_path):
+        directory = snapshot_dir(db_path, owner)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, datetime.now().strftime(SNAPSHOT_TIME_FORMAT) + SNAPSHOT_SUFFIX)
+        partial_path = f"{path}.partial"
+        try:
+            backup_database(db_path, partial_path, pages, sleep)
+            # Only complete snapshots ever carry the snapshot suffix
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        if prune:
+            prune_snapshots(db_path, retention, owner)
+    return path
+
+
+def get_snapshot_error(db_path):
+    """Return the error from the last failed background snapshot, if any."""
+    return _snapshot_errors.get(os.path.abspath(db_path))
+
+
+def _snapshot_worker(db_path, retention, owner):
+    try:
+        take_snapshot(db_path, retention, owner=owner)
+        _snapshot_errors.pop(os.path.abspath(db_path), None)
+    except Exception as e:
+        _snapshot_errors[os.path.abspath(db_path)] = str(e)
+
+
+def start_snapshot(db_path, retention=SNAPSHOT_RETENTION, owner=None):
+    """Take a snapshot on a background thread and return the thread."""
+    thread = threading.Thread(
+        target=_snapshot_worker,
+        args=(db_path, retention, owner),
+        name=f"snapshot-{os.path.abspath(db_path)}",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def is_snapshot_running(db_path):
+    name = f"snapshot-{os.path.abspath(db_path)}"
+    return any(t.name == name and t.is_alive() for t in threading.enumerate())
+
+
+def restore_snapshot(snapshot_path, db_path, owner=None):
+    """Restore a snapshot over the live database.
+
+    The current contents are snapshotted first (without pruning) so a
+    restore can itself be undone.
+    """
+    with _snapshot_lock(db_path):
+        take_snapshot(db_path, prune=False, owner=owner)
+        backup_database(snapshot_path, db_path, pages=-1, sleep=0)
+
+
+def _measure_latency(operation, duration, interval=0.0):
+    latencies = []
+    end_time = time.perf_counter() + duration
+    while time.perf_counter() < end_time:
+        start = time.perf_counter()
+        operation(len(latencies))
+        latencies.append((time.perf_counter() - start) * 1000)
+        if interval:
+            time.sleep(interval)
+    return latencies
+
+
+def _format_latency(label, latencies):
+    ordered = sorted(latencies)
+    p = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+    return (f"{label:<30} ops={len(ordered):>7}  p50={statistics.median(ordered):.3f}ms  "
+            f"p99={p(0.99):.3f}ms  max={ordered[-1]:.3f}ms")
+
+
+def _run_with_snapshots(db_path, target_path, pages, sleep, measure):
+    """Run measure() while snapshots are taken in a loop; return (latencies, snapshot stats)."""
+    stop_event = threading.Event()
+    stats = {"times": [], "restarts": 0, "errors": 0}
+
+    def snapshot_loop():
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                stats["restarts"] += backup_database(db_path, target_path, pages=pages, sleep=sleep)
+                stats["times"].append(time.perf_counter() - start)
+            except TimeoutError:
+                stats["errors"] += 1
+
+    thread = threading.Thread(target=snapshot_loop, daemon=True)
+    thread.start()
+    latencies = measure()
+    stop_event.set()
+    thread.join()
+    return latencies, stats
+
+
+def run_benchmark(rows, duration=3.0, write_interval=0.01):
+    """Compare read and write latency with no snapshot, paced snapshots and single-step snapshots."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        target_path = os.path.join(tmp_dir, "snapshot.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, price REAL, note TEXT)")
+        conn.executemany(
+            "INSERT INTO items (name, price, note) VALUES (?, ?, ?)",
+            ((f"item {i}", i % 1000 / 10, "x" * 100) for i in range(rows)),
+        )
+        conn.commit()
+
+        def read(i):
+            conn.execute(
+                "SELECT COUNT(*), AVG(price) FROM items WHERE id BETWEEN ? AND ?",
+                (i * 97 % rows, i * 97 % rows + 500),
+            ).fetchall()
+
+        def write(i):
+            conn.execute("INSERT INTO items (name, price, note) VALUES (?, ?, ?)", (f"new {i}", 1.0, "y"))
+            conn.commit()
+
+        scenarios = (("paced snapshots", SNAPSHOT_PAGES_PER_STEP, SNAPSHOT_STEP_SLEEP),
+                     ("single-step snapshots", -1, 0))
+        try:
+            for kind, operation, interval in (("reads", read, 0.0), ("writes", write, write_interval)):
+                measure = lambda: _measure_latency(operation, duration, interval)
+                print(_format_latency(f"{kind}, no snapshot", measure()))
+                for label, pages, sleep in scenarios:
+                    latencies, stats = _run_with_snapshots(db_path, target_path, pages, sleep, measure)
+                    average = statistics.mean(stats["times"]) if stats["times"] else 0.0
+                    print(_format_latency(f"{kind}, {label}", latencies)
+                          + f"  snapshots={len(stats['times'])} avg={average:.2f}s"
+                          + f" restarts={stats['restarts']} timeouts={stats['errors']}")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark snapshot impact on read and write latency")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--write-interval", type=float, default=0.01,
+                        help="Seconds between commits in the concurrent-writer case")
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.duration, args.write_interval)